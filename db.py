@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import re
+import time
+from threading import RLock
+
+import aiomysql
+import pymysql
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from fastapi import HTTPException
+import os
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# MySQL configuration
+MYSQL_CONFIG = {
+    "host": os.getenv("MYSQL_HOST"),
+    "user": os.getenv("MYSQL_USER"),
+    "password": os.getenv("MYSQL_PASSWORD"),
+    "db": os.getenv("MYSQL_DATABASE"),
+    "port": int(os.getenv("MYSQL_PORT", 3306)),
+    "charset": "utf8mb4",
+    "use_unicode": True,
+    "cursorclass": aiomysql.DictCursor
+}
+
+# Connection pool, created in the application lifespan
+pool: aiomysql.Pool | None = None
+
+POOL_MIN_SIZE = int(os.getenv("MYSQL_POOL_MIN_SIZE", 5))
+POOL_MAX_SIZE = int(os.getenv("MYSQL_POOL_MAX_SIZE", 25))
+
+# Create the connection pool (called from the FastAPI lifespan)
+async def init_pool():
+    global pool
+    pool = await aiomysql.create_pool(minsize=POOL_MIN_SIZE, maxsize=POOL_MAX_SIZE, autocommit=True, **MYSQL_CONFIG)
+    logger.debug("MySQL connection pool created (min=%s, max=%s)", POOL_MIN_SIZE, POOL_MAX_SIZE)
+
+# Close the connection pool (called from the FastAPI lifespan)
+async def close_pool():
+    pool.close()
+    await pool.wait_closed()
+
+# Utility function to acquire a pooled MySQL connection, retrying with
+# exponential backoff (0.1s, 0.2s, 0.4s) so an outage caps the extra
+# wait per request well under a second instead of stalling for 6s
+async def connect_mysql():
+    for attempt in range(3):
+        try:
+            conn = await pool.acquire()
+            logger.debug("MySQL connection acquired from pool")
+            return conn
+        except pymysql.MySQLError as e:
+            logger.error("MySQL connection attempt %s failed: %s", attempt + 1, e)
+            await asyncio.sleep(0.1 * (2 ** attempt))
+    raise HTTPException(status_code=500, detail="MySQL connection failed after retries")
+
+# Return a pooled connection acquired via connect_mysql
+def release_mysql(conn):
+    pool.release(conn)
+
+# Valid table-name pattern, compiled once at import time
+_TABLE_NAME_RE = re.compile(r'\A[A-Za-z_][A-Za-z0-9_]*\Z')
+
+# Utility to validate and sanitize table_name
+def sanitize_table_name(table_name: str) -> str:
+    if not table_name or not _TABLE_NAME_RE.match(table_name):
+        logger.error("Invalid table name: %s", table_name)
+        raise HTTPException(status_code=400, detail="Invalid table name")
+    return table_name
+
+# Stale-while-revalidate cache for expensive fetches: fresh hits return
+# immediately, stale hits return the old value and kick off a background
+# refresh, so a cache expiry never blocks a burst of requests. Only the
+# first request past expiry schedules the refresh (single-flight).
+_swr_cache = {}
+_swr_refreshing = set()
+_inflight: dict = {}
+# Strong references to in-flight refresh tasks; the event loop only keeps
+# weak ones, so without this a background refresh can be GC'd mid-flight
+_swr_tasks = set()
+
+# Drop all cached values (used by cache invalidation endpoints); in-flight
+# single-flight futures are left alone so waiting callers still resolve
+def clear_swr_cache():
+    _swr_cache.clear()
+
+async def swr_fetch(key, loader, ttl=30, stale_ttl=120):
+    now = time.monotonic()
+    entry = _swr_cache.get(key)
+    if entry is not None:
+        value, expires_at, stale_until = entry
+        if now < expires_at:
+            return value
+        if now < stale_until:
+            if key not in _swr_refreshing:
+                _swr_refreshing.add(key)
+                task = asyncio.create_task(_swr_refresh(key, loader, ttl, stale_ttl))
+                _swr_tasks.add(task)
+                task.add_done_callback(_swr_tasks.discard)
+            return value
+    # Cold miss: coalesce concurrent callers onto a single query so N
+    # simultaneous dashboard opens cost one MySQL round-trip, not N
+    future = _inflight.get(key)
+    if future is not None:
+        return await future
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await loader()
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved in case no other caller awaits it
+        raise
+    else:
+        _swr_cache[key] = (value, now + ttl, now + ttl + stale_ttl)
+        future.set_result(value)
+        return value
+    finally:
+        _inflight.pop(key, None)
+
+async def _swr_refresh(key, loader, ttl, stale_ttl):
+    try:
+        value = await loader()
+        now = time.monotonic()
+        _swr_cache[key] = (value, now + ttl, now + ttl + stale_ttl)
+    except Exception as e:
+        logger.error("Background cache refresh failed for %s: %s", key, e)
+    finally:
+        _swr_refreshing.discard(key)
+
+# In-process TTL cache for project_id -> table_name lookups; the projects
+# table changes rarely, so a short TTL collapses the per-request SELECT.
+# RLock keeps it safe when handlers run in the threadpool.
+_table_name_cache = TTLCache(maxsize=128, ttl=60)
+_table_name_lock = RLock()
+
+# Drop all cached table names (used by cache invalidation endpoints)
+def clear_table_name_cache():
+    with _table_name_lock:
+        _table_name_cache.clear()
+
+# Utility to get table_name from projects table. On a miss the whole
+# projects table is loaded (it is small) and sanitized once, so a burst
+# of requests across projects costs a single SELECT per TTL window.
+async def get_metrics_table(project_id: int) -> str:
+    with _table_name_lock:
+        cached_name = _table_name_cache.get(project_id)
+    if cached_name is not None:
+        return cached_name
+    conn = await connect_mysql()
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT project_id, table_name FROM projects")
+            rows = await cursor.fetchall()
+    except pymysql.MySQLError as e:
+        logger.error("Error fetching table_name for project_id %s: %s", project_id, e)
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        release_mysql(conn)
+    requested_name = None
+    with _table_name_lock:
+        for row in rows:
+            if row["project_id"] == project_id:
+                requested_name = row["table_name"]
+            try:
+                _table_name_cache[row["project_id"]] = sanitize_table_name(row["table_name"])
+            except HTTPException:
+                continue
+    if requested_name is None:
+        logger.error("No table found for project_id %s", project_id)
+        raise HTTPException(status_code=404, detail="Project not found")
+    table_name = sanitize_table_name(requested_name)
+    logger.debug("Table name for project_id %s: %s", project_id, table_name)
+    return table_name
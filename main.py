@@ -1,33 +1,75 @@
+import asyncio
+import hashlib
 import logging
-import re
-import time
-from fastapi import FastAPI, Query, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.middleware.gzip import GZipMiddleware
+import aiomysql
+import orjson
 import pymysql
+from pymysql.constants import ER
 from datetime import datetime, timedelta
 from typing import List
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import PickleCoder
+from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
 import os
 
+from db import connect_mysql, release_mysql, get_metrics_table, init_pool, close_pool, swr_fetch, clear_swr_cache, clear_table_name_cache
+
 # Load environment variables
 load_dotenv()
 
-# Logging
-logging.basicConfig(level=logging.DEBUG)
+# Logging; INFO by default so large result payloads are never stringified
+# on hot paths, switch to DEBUG via LOG_LEVEL when diagnosing
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO))
 logger = logging.getLogger(__name__)
 
-# MySQL configuration
-MYSQL_CONFIG = {
-    "host": os.getenv("MYSQL_HOST"),
-    "user": os.getenv("MYSQL_USER"),
-    "password": os.getenv("MYSQL_PASSWORD"),
-    "database": os.getenv("MYSQL_DATABASE"),
-    "port": int(os.getenv("MYSQL_PORT", 3306)),
-    "cursorclass": pymysql.cursors.DictCursor
-}
+# Response cache configuration; without REDIS_URL the cache falls back
+# to an in-process backend so caching works on single-worker deployments
+# with no Redis
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_EXPIRE_SECONDS = int(os.getenv("CACHE_EXPIRE_SECONDS", 30))
+
+# Cache key builder: isolate entries per path + query string so
+# /metrics/{project_id}/* endpoints never share cache entries. The
+# decorator already folds FastAPICache's prefix into namespace, so the
+# builder must not prepend it again.
+def cache_key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    if request is not None:
+        return f"{namespace}:{request.url.path}?{request.url.query}"
+    return f"{namespace}:{func.__module__}:{func.__name__}:{args}:{kwargs}"
+
+# Lifespan: initialize the MySQL connection pool and Redis-backed response cache
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_pool()
+    redis_client = None
+    if REDIS_URL:
+        redis_client = aioredis.from_url(REDIS_URL)
+        FastAPICache.init(RedisBackend(redis_client), prefix="metrics-cache", coder=PickleCoder, key_builder=cache_key_builder)
+        logger.debug("Response cache initialized on %s", REDIS_URL)
+    else:
+        FastAPICache.init(InMemoryBackend(), prefix="metrics-cache", coder=PickleCoder, key_builder=cache_key_builder)
+        logger.debug("Response cache initialized in-process (REDIS_URL not set)")
+    yield
+    if redis_client is not None:
+        await redis_client.close()
+    await close_pool()
 
 # Initialize FastAPI
-app = FastAPI(title="Report System Dashboard API")
+app = FastAPI(title="Report System Dashboard API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Compress large JSON responses (repeated keys and ISO dates compress well)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Pydantic models
 class Metrics(BaseModel):
@@ -68,44 +110,98 @@ class Project(BaseModel):
     project_name: str
     table_name: str
 
-# Utility function to connect to MySQL with retry
-def connect_mysql():
-    config = MYSQL_CONFIG.copy()
-    for attempt in range(3):
-        try:
-            conn = pymysql.connect(**config)
-            logger.debug("MySQL connection established")
-            return conn
-        except pymysql.MySQLError as e:
-            logger.error(f"MySQL connection attempt {attempt + 1} failed: {e}")
-            time.sleep(2)
-    raise HTTPException(status_code=500, detail="MySQL connection failed after retries")
-
-# Utility to validate and sanitize table_name
-def sanitize_table_name(table_name: str) -> str:
-    if not table_name or not re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', table_name):
-        logger.error(f"Invalid table name: {table_name}")
-        raise HTTPException(status_code=400, detail="Invalid table name")
-    return table_name
-
-# Utility to get table_name from projects table
-def get_metrics_table(project_id: int) -> str:
-    conn = connect_mysql()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT table_name FROM projects WHERE project_id = %s", (project_id,))
-            result = cursor.fetchone()
-            if not result:
-                logger.error(f"No table found for project_id {project_id}")
-                raise HTTPException(status_code=404, detail="Project not found")
-            table_name = sanitize_table_name(result["table_name"])
-            logger.debug(f"Table name for project_id {project_id}: {table_name}")
-            return table_name
-    except pymysql.MySQLError as e:
-        logger.error(f"Error fetching table_name for project_id {project_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+# SQL templates, built once at import time; {table} is filled with a
+# sanitized table name per request
+PROJECTS_SQL = "SELECT project_id, project_name, table_name FROM projects"
+
+LATEST_METRICS_SQL = """
+    SELECT id, project_name, table_name, update_count,
+           top_user, top_user_count, total_users,
+           detected_timestamp, last_updated
+    FROM `{table}`
+    ORDER BY last_updated DESC LIMIT 1
+"""
+
+# Range predicate instead of DATE(last_updated) = %s so MySQL can
+# range-seek an index on last_updated rather than scanning every row
+METRICS_FOR_DATE_SQL = """
+    SELECT
+        SUM(update_count) AS total_update_count,
+        MAX(top_user) AS top_user,
+        MAX(top_user_count) AS top_user_count,
+        MAX(total_users) AS total_users
+    FROM `{table}`
+    WHERE last_updated >= %s AND last_updated < %s + INTERVAL 1 DAY
+"""
+
+# Today's window is evaluated server-side with CURDATE() so the query
+# text is constant (no per-request date parameter to build) and sargable
+METRICS_TODAY_SQL = """
+    SELECT
+        SUM(update_count) AS total_update_count,
+        MAX(top_user) AS top_user,
+        MAX(top_user_count) AS top_user_count,
+        MAX(total_users) AS total_users
+    FROM `{table}`
+    WHERE last_updated >= CURDATE() AND last_updated < CURDATE() + INTERVAL 1 DAY
+"""
+
+ENTRIES_PER_DAY_SQL = """
+    SELECT DATE(last_updated) AS day, SUM(update_count) AS total_updates
+    FROM `{table}`
+    WHERE last_updated >= CURDATE() - INTERVAL 30 DAY
+    GROUP BY DATE(last_updated)
+    ORDER BY DATE(last_updated)
+"""
+
+ENTRIES_PER_WEEKDAY_SQL = """
+    SELECT
+        weekday,
+        SUM(update_count) AS total_updates
+    FROM `{table}`
+    WHERE last_updated >= CURDATE() - INTERVAL 30 DAY
+    GROUP BY weekday
+    ORDER BY FIELD(weekday, 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+"""
+
+ENTRIES_PER_MONTH_SQL = """
+    SELECT
+        DATE_FORMAT(last_updated, '%M') AS month,
+        SUM(update_count) AS total_updates
+    FROM `{table}`
+    WHERE last_updated >= CURDATE() - INTERVAL 6 MONTH
+    GROUP BY DATE_FORMAT(last_updated, '%M')
+    ORDER BY MIN(last_updated)
+"""
+
+# Rollup variants reading the precomputed `{table}_daily` table
+# (see sql/rollup_daily.sql); 30/180 rows instead of every raw row
+ENTRIES_PER_DAY_ROLLUP_SQL = """
+    SELECT day, total_updates
+    FROM `{table}_daily`
+    WHERE day >= CURDATE() - INTERVAL 30 DAY
+    ORDER BY day
+"""
+
+ENTRIES_PER_WEEKDAY_ROLLUP_SQL = """
+    SELECT
+        DAYNAME(day) AS weekday,
+        SUM(total_updates) AS total_updates
+    FROM `{table}_daily`
+    WHERE day >= CURDATE() - INTERVAL 30 DAY
+    GROUP BY DAYNAME(day)
+    ORDER BY FIELD(DAYNAME(day), 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+"""
+
+ENTRIES_PER_MONTH_ROLLUP_SQL = """
+    SELECT
+        DATE_FORMAT(day, '%M') AS month,
+        SUM(total_updates) AS total_updates
+    FROM `{table}_daily`
+    WHERE day >= CURDATE() - INTERVAL 6 MONTH
+    GROUP BY DATE_FORMAT(day, '%M')
+    ORDER BY MIN(day)
+"""
 
 # Utility to format DD/MM/YYYY to YYYY-MM-DD
 def format_date(date_str: str) -> str:
@@ -116,264 +212,331 @@ def format_date(date_str: str) -> str:
         raise HTTPException(status_code=400, detail="Invalid date format. Use DD/MM/YYYY.")
 
 # Endpoint: /projects
-@app.get("/projects", response_model=dict)
+@app.get("/projects")
+@cache(expire=CACHE_EXPIRE_SECONDS)
 async def list_projects():
-    conn = connect_mysql()
+    conn = await connect_mysql()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT project_id, project_name, table_name FROM projects")
-            projects = cursor.fetchall()
-            logger.debug(f"Projects: {projects}")
+        async with conn.cursor() as cursor:
+            await cursor.execute(PROJECTS_SQL)
+            projects = await cursor.fetchall()
+            logger.debug("Projects: %s", projects)
             return {"projects": projects}
     except pymysql.MySQLError as e:
-        logger.error(f"Error fetching projects: {e}")
+        logger.error("Error fetching projects: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch projects: {str(e)}")
     finally:
-        conn.close()
+        release_mysql(conn)
 
-# Endpoint: /metrics/{project_id}
-@app.get("/metrics/{project_id}", response_model=dict)
-async def get_project_metrics(project_id: int):
-    table_name = get_metrics_table(project_id)
-    conn = connect_mysql()
+# Internal: stream project rows via a server-side cursor so neither the
+# MySQL client buffer nor this process materializes the full result set
+async def _stream_projects():
+    conn = await connect_mysql()
     try:
-        with conn.cursor() as cursor:
-            query = f"""
-                SELECT id, project_name, table_name, update_count,
-                       top_user, top_user_count, total_users,
-                       detected_timestamp, last_updated
-                FROM `{table_name}`
-                ORDER BY last_updated DESC LIMIT 1
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
+        async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+            await cursor.execute(PROJECTS_SQL)
+            while True:
+                row = await cursor.fetchone()
+                if row is None:
+                    break
+                yield orjson.dumps(row) + b"\n"
+    finally:
+        release_mysql(conn)
+
+# Endpoint: /projects/stream (newline-delimited JSON, one project per line;
+# rows start flowing before the last one is read, keeping memory flat as
+# the projects table grows)
+@app.get("/projects/stream")
+async def stream_projects():
+    return StreamingResponse(_stream_projects(), media_type="application/x-ndjson")
+
+# Internal: fetch the latest metrics row for one project, served through the
+# stale-while-revalidate cache so expiry never blocks a burst of requests
+async def fetch_latest_metrics(project_id: int) -> dict:
+    return await swr_fetch(("latest_metrics", project_id), lambda: _query_latest_metrics(project_id), ttl=CACHE_EXPIRE_SECONDS)
+
+async def _query_latest_metrics(project_id: int) -> dict:
+    table_name = await get_metrics_table(project_id)
+    conn = await connect_mysql()
+    try:
+        async with conn.cursor() as cursor:
+            query = LATEST_METRICS_SQL.format(table=table_name)
+            await cursor.execute(query)
+            result = await cursor.fetchone()
             if not result:
-                logger.warning(f"No metrics found for table {table_name}")
+                logger.warning("No metrics found for table %s", table_name)
                 raise HTTPException(status_code=404, detail="No metrics found")
-            logger.debug(f"Latest metrics for project {project_id}: {result}")
-            return {"metrics": result}
+            return result
     except pymysql.ProgrammingError as e:
-        logger.error(f"Query error for project {project_id}, table {table_name}: {e}")
+        logger.error("Query error for project %s, table %s: %s", project_id, table_name, e)
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
     except pymysql.MySQLError as e:
-        logger.error(f"Database error for project {project_id}, table {table_name}: {e}")
+        logger.error("Database error for project %s, table %s: %s", project_id, table_name, e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
-        conn.close()
+        release_mysql(conn)
+
+# Endpoint: /metrics/all (declared before /metrics/{project_id} so "all" is not parsed as an ID)
+@app.get("/metrics/all")
+@cache(expire=CACHE_EXPIRE_SECONDS)
+async def get_all_metrics(project_ids: str = Query(..., description="Comma-separated project IDs")):
+    try:
+        ids = [int(pid) for pid in project_ids.split(",") if pid.strip()]
+    except ValueError:
+        logger.error("Invalid project_ids parameter: %s", project_ids)
+        raise HTTPException(status_code=400, detail="project_ids must be comma-separated integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No project IDs provided")
+    # return_exceptions so one bad project reports its own error instead of
+    # failing the whole batch and leaving sibling fetches running detached
+    results = await asyncio.gather(*[fetch_latest_metrics(pid) for pid in ids], return_exceptions=True)
+    metrics = {}
+    errors = {}
+    for pid, result in zip(ids, results):
+        if isinstance(result, HTTPException):
+            errors[str(pid)] = {"status_code": result.status_code, "detail": result.detail}
+        elif isinstance(result, BaseException):
+            logger.error("Unexpected error fetching metrics for project %s: %s", pid, result)
+            errors[str(pid)] = {"status_code": 500, "detail": f"Unexpected error: {str(result)}"}
+        else:
+            metrics[str(pid)] = result
+    logger.debug("Batch metrics for projects %s (%s errors)", ids, len(errors))
+    payload = {"metrics": metrics}
+    if errors:
+        payload["errors"] = errors
+    return payload
+
+# Endpoint: /metrics/{project_id}
+@app.get("/metrics/{project_id}")
+@cache(expire=CACHE_EXPIRE_SECONDS)
+async def get_project_metrics(project_id: int):
+    result = await fetch_latest_metrics(project_id)
+    logger.debug("Latest metrics for project %s: %s", project_id, result)
+    return {"metrics": result}
 
 # Endpoint: /metrics/{project_id}/by-date
-@app.get("/metrics/{project_id}/by-date", response_model=dict)
+@app.get("/metrics/{project_id}/by-date")
+@cache(expire=CACHE_EXPIRE_SECONDS)
 async def get_metrics_by_date(project_id: int, date: str = Query(..., description="Date in DD/MM/YYYY format")):
     try:
         formatted_date = format_date(date)
-        table_name = get_metrics_table(project_id)
-        conn = connect_mysql()
+        table_name = await get_metrics_table(project_id)
+        conn = await connect_mysql()
         try:
-            with conn.cursor() as cursor:
-                query = f"""
-                    SELECT
-                        SUM(update_count) AS total_update_count,
-                        MAX(top_user) AS top_user,
-                        MAX(top_user_count) AS top_user_count,
-                        MAX(total_users) AS total_users
-                    FROM `{table_name}`
-                    WHERE DATE(last_updated) = %s
-                """
-                cursor.execute(query, (formatted_date,))
-                result = cursor.fetchone()
+            async with conn.cursor() as cursor:
+                query = METRICS_FOR_DATE_SQL.format(table=table_name)
+                await cursor.execute(query, (formatted_date, formatted_date))
+                result = await cursor.fetchone()
                 if not result or result["total_update_count"] is None:
-                    logger.warning(f"No metrics found for {formatted_date} in table {table_name}")
+                    logger.warning("No metrics found for %s in table %s", formatted_date, table_name)
                     raise HTTPException(status_code=404, detail=f"No metrics found for {formatted_date}")
-                logger.debug(f"Metrics for project {project_id} on {formatted_date}: {result}")
+                logger.debug("Metrics for project %s on %s: %s", project_id, formatted_date, result)
                 return {"metrics": result}
         except pymysql.ProgrammingError as e:
-            logger.error(f"Query error for project {project_id} by date: {e}")
+            logger.error("Query error for project %s by date: %s", project_id, e)
             raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
         except pymysql.MySQLError as e:
-            logger.error(f"Database error for project {project_id} by date: {e}")
+            logger.error("Database error for project %s by date: %s", project_id, e)
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
         finally:
-            conn.close()
+            release_mysql(conn)
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error for project {project_id} by date: {e}")
+        logger.error("Unexpected error for project %s by date: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 # Endpoint: /metrics/{project_id}/today
-@app.get("/metrics/{project_id}/today", response_model=dict)
+@app.get("/metrics/{project_id}/today")
+@cache(expire=CACHE_EXPIRE_SECONDS)
 async def get_metrics_today(project_id: int):
     try:
-        today_date = datetime.today().strftime("%Y-%m-%d")
-        table_name = get_metrics_table(project_id)
-        conn = connect_mysql()
-        try:
-            with conn.cursor() as cursor:
-                query = f"""
-                    SELECT
-                        SUM(update_count) AS total_update_count,
-                        MAX(top_user) AS top_user,
-                        MAX(top_user_count) AS top_user_count,
-                        MAX(total_users) AS total_users
-                    FROM `{table_name}`
-                    WHERE DATE(last_updated) = %s
-                """
-                cursor.execute(query, (today_date,))
-                result = cursor.fetchone()
-                if not result or result["total_update_count"] is None:
-                    logger.warning(f"No metrics found for today in table {table_name}")
-                    raise HTTPException(status_code=404, detail="No metrics found for today")
-                logger.debug(f"Today's metrics for project {project_id}: {result}")
-                return {"metrics": result}
-        except pymysql.ProgrammingError as e:
-            logger.error(f"Query error for today's metrics for project {project_id}: {e}")
-            raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
-        except pymysql.MySQLError as e:
-            logger.error(f"Database error for today's metrics for project {project_id}: {e}")
-            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-        finally:
-            conn.close()
+        result = await fetch_metrics_today(project_id)
+        logger.debug("Today's metrics for project %s: %s", project_id, result)
+        return {"metrics": result}
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error for today's metrics for project {project_id}: {e}")
+        logger.error("Unexpected error for today's metrics for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-# Endpoint: /metrics/{project_id}/total-users
-@app.get("/metrics/{project_id}/total-users", response_model=dict)
-async def get_total_users(project_id: int):
-    table_name = get_metrics_table(project_id)
-    conn = connect_mysql()
+# Internal: fetch today's aggregated metrics for one project
+async def fetch_metrics_today(project_id: int) -> dict:
+    table_name = await get_metrics_table(project_id)
+    conn = await connect_mysql()
     try:
-        with conn.cursor() as cursor:
-            query = f"SELECT total_users FROM `{table_name}` ORDER BY last_updated DESC LIMIT 1"
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if not result:
-                logger.warning(f"No total users found for table {table_name}")
-                raise HTTPException(status_code=404, detail="No total users found")
-            logger.debug(f"Total users for project {project_id}: {result}")
-            return {"total_users": result["total_users"] or 0}
+        async with conn.cursor() as cursor:
+            query = METRICS_TODAY_SQL.format(table=table_name)
+            await cursor.execute(query)
+            result = await cursor.fetchone()
+            if not result or result["total_update_count"] is None:
+                logger.warning("No metrics found for today in table %s", table_name)
+                raise HTTPException(status_code=404, detail="No metrics found for today")
+            return result
     except pymysql.ProgrammingError as e:
-        logger.error(f"Query error for total users for project {project_id}: {e}")
+        logger.error("Query error for today's metrics for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
     except pymysql.MySQLError as e:
-        logger.error(f"Database error for total users for project {project_id}: {e}")
+        logger.error("Database error for today's metrics for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
-        conn.close()
+        release_mysql(conn)
+
+# Endpoint: /metrics/{project_id}/total-users
+@app.get("/metrics/{project_id}/total-users")
+@cache(expire=CACHE_EXPIRE_SECONDS)
+async def get_total_users(project_id: int):
+    result = await fetch_latest_metrics(project_id)
+    logger.debug("Total users for project %s: %s", project_id, result['total_users'])
+    return {"total_users": result["total_users"] or 0}
 
 # Endpoint: /metrics/{project_id}/top-user
-@app.get("/metrics/{project_id}/top-user", response_model=TopUser)
+@app.get("/metrics/{project_id}/top-user")
+@cache(expire=CACHE_EXPIRE_SECONDS)
 async def get_top_user(project_id: int):
-    table_name = get_metrics_table(project_id)
-    conn = connect_mysql()
+    result = await fetch_latest_metrics(project_id)
+    logger.debug("Top user for project %s: %s", project_id, result['top_user'])
+    return {
+        "top_user": result["top_user"],
+        "entry_count": result["top_user_count"] or 0
+    }
+
+# Endpoint: /metrics/{project_id}/bundle
+@app.get("/metrics/{project_id}/bundle")
+@cache(expire=CACHE_EXPIRE_SECONDS)
+async def get_metrics_bundle(project_id: int, fields: str = Query("metrics,total_users,top_user", description="Comma-separated subset of: metrics, total_users, top_user, today, entries_per_day")):
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    if not requested:
+        raise HTTPException(status_code=400, detail="No fields requested")
+    invalid = requested - {"metrics", "total_users", "top_user", "today", "entries_per_day"}
+    if invalid:
+        logger.error("Invalid bundle fields requested: %s", invalid)
+        raise HTTPException(status_code=400, detail=f"Invalid fields: {', '.join(sorted(invalid))}")
+    # Independent datasets are fetched concurrently so the bundle costs
+    # the slowest query, not the sum of them
+    tasks = {}
+    if requested & {"metrics", "total_users", "top_user"}:
+        tasks["latest"] = fetch_latest_metrics(project_id)
+    if "today" in requested:
+        tasks["today"] = fetch_metrics_today(project_id)
+    if "entries_per_day" in requested:
+        tasks["entries_per_day"] = fetch_entries_per_day(project_id)
+    results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+    bundle = {}
+    latest = results.get("latest")
+    if "metrics" in requested:
+        bundle["metrics"] = latest
+    if "total_users" in requested:
+        bundle["total_users"] = latest["total_users"] or 0
+    if "top_user" in requested:
+        bundle["top_user"] = {
+            "top_user": latest["top_user"],
+            "entry_count": latest["top_user_count"] or 0
+        }
+    if "today" in requested:
+        bundle["today"] = results["today"]
+    if "entries_per_day" in requested:
+        bundle["entries_per_day"] = results["entries_per_day"]
+    logger.debug("Bundle for project %s: %s", project_id, bundle)
+    return bundle
+
+# Internal: run an entries query against the precomputed daily rollup,
+# falling back to aggregating the raw metrics table when the rollup
+# table has not been created for this project
+async def fetch_entries(table_name: str, rollup_sql: str, raw_sql: str) -> list:
+    conn = await connect_mysql()
     try:
-        with conn.cursor() as cursor:
-            query = f"SELECT top_user, top_user_count FROM `{table_name}` ORDER BY last_updated DESC LIMIT 1"
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if not result:
-                logger.warning(f"No top user found for table {table_name}")
-                raise HTTPException(status_code=404, detail="No top user found")
-            logger.debug(f"Top user for project {project_id}: {result}")
-            return {
-                "top_user": result["top_user"],
-                "entry_count": result["top_user_count"] or 0
-            }
-    except pymysql.ProgrammingError as e:
-        logger.error(f"Query error for top user for project {project_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
-    except pymysql.MySQLError as e:
-        logger.error(f"Database error for top user for project {project_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute(rollup_sql.format(table=table_name))
+            except pymysql.ProgrammingError as e:
+                if e.args[0] != ER.NO_SUCH_TABLE:
+                    raise
+                logger.debug("No daily rollup for %s, aggregating raw rows", table_name)
+                await cursor.execute(raw_sql.format(table=table_name))
+            return await cursor.fetchall()
     finally:
-        conn.close()
+        release_mysql(conn)
+
+# Conditional response helper: the slow-changing aggregate payloads get
+# an ETag so polling clients re-download only when the data changed.
+# MySQL returns SUM() aggregates as decimal.Decimal, which orjson refuses
+# to serialize, so the payload is encoded once for both the hash and the
+# body; the ETag is emitted as an RFC 7232 quoted string so proxies that
+# normalize If-None-Match still match.
+def conditional_json(request: Request, payload: dict) -> Response:
+    encoded = jsonable_encoder(payload)
+    etag = f'"{hashlib.blake2b(orjson.dumps(encoded), digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CACHE_EXPIRE_SECONDS}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(encoded, headers=headers)
 
 # Endpoint: /metrics/{project_id}/entries-per-day
-@app.get("/metrics/{project_id}/entries-per-day", response_model=dict)
-async def get_entries_per_day(project_id: int):
-    table_name = get_metrics_table(project_id)
-    conn = connect_mysql()
+@app.get("/metrics/{project_id}/entries-per-day")
+async def get_entries_per_day(project_id: int, request: Request):
+    result = await swr_fetch(("entries_per_day", project_id), lambda: fetch_entries_per_day(project_id), ttl=CACHE_EXPIRE_SECONDS)
+    logger.debug("Daily entries for project %s: %s", project_id, result)
+    return conditional_json(request, {"entries_per_day": result})
+
+# Internal: fetch the 30-day per-day entries for one project
+async def fetch_entries_per_day(project_id: int) -> list:
+    table_name = await get_metrics_table(project_id)
     try:
-        with conn.cursor() as cursor:
-            query = f"""
-                SELECT DATE(last_updated) AS day, SUM(update_count) AS total_updates
-                FROM `{table_name}`
-                WHERE last_updated >= CURDATE() - INTERVAL 30 DAY
-                GROUP BY DATE(last_updated)
-                ORDER BY DATE(last_updated)
-            """
-            cursor.execute(query)
-            result = cursor.fetchall()
-            logger.debug(f"Daily entries for project {project_id}: {result}")
-            return {"entries_per_day": result}
+        return await fetch_entries(table_name, ENTRIES_PER_DAY_ROLLUP_SQL, ENTRIES_PER_DAY_SQL)
     except pymysql.ProgrammingError as e:
-        logger.error(f"Query error for daily entries for project {project_id}: {e}")
+        logger.error("Query error for daily entries for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
     except pymysql.MySQLError as e:
-        logger.error(f"Database error for daily entries for project {project_id}: {e}")
+        logger.error("Database error for daily entries for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
 
 # Endpoint: /metrics/{project_id}/entries-per-weekday
-@app.get("/metrics/{project_id}/entries-per-weekday", response_model=dict)
-async def get_entries_per_weekday(project_id: int):
-    table_name = get_metrics_table(project_id)
-    conn = connect_mysql()
+@app.get("/metrics/{project_id}/entries-per-weekday")
+async def get_entries_per_weekday(project_id: int, request: Request):
+    result = await swr_fetch(("entries_per_weekday", project_id), lambda: fetch_entries_per_weekday(project_id), ttl=CACHE_EXPIRE_SECONDS)
+    logger.debug("Weekday entries for project %s: %s", project_id, result)
+    return conditional_json(request, {"entries_per_weekday": result})
+
+# Internal: fetch the 30-day per-weekday entries for one project
+async def fetch_entries_per_weekday(project_id: int) -> list:
+    table_name = await get_metrics_table(project_id)
     try:
-        with conn.cursor() as cursor:
-            query = f"""
-                SELECT 
-                    weekday AS weekday_name, 
-                    SUM(update_count) AS total_updates
-                FROM `{table_name}`
-                WHERE last_updated >= CURDATE() - INTERVAL 30 DAY
-                GROUP BY weekday
-                ORDER BY FIELD(weekday, 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
-            """
-            cursor.execute(query)
-            result = [{"weekday": row["weekday_name"], "total_updates": row["total_updates"]} for row in cursor.fetchall()]
-            logger.debug(f"Weekday entries for project {project_id}: {result}")
-            return {"entries_per_weekday": result}
+        return await fetch_entries(table_name, ENTRIES_PER_WEEKDAY_ROLLUP_SQL, ENTRIES_PER_WEEKDAY_SQL)
     except pymysql.ProgrammingError as e:
-        logger.error(f"Query error for weekday entries for project {project_id}: {e}")
+        logger.error("Query error for weekday entries for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
     except pymysql.MySQLError as e:
-        logger.error(f"Database error for weekday entries for project {project_id}: {e}")
+        logger.error("Database error for weekday entries for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
 
 # Endpoint: /metrics/{project_id}/entries-per-month
-@app.get("/metrics/{project_id}/entries-per-month", response_model=dict)
-async def get_entries_per_month(project_id: int):
-    table_name = get_metrics_table(project_id)
-    conn = connect_mysql()
+@app.get("/metrics/{project_id}/entries-per-month")
+async def get_entries_per_month(project_id: int, request: Request):
+    result = await swr_fetch(("entries_per_month", project_id), lambda: fetch_entries_per_month(project_id), ttl=CACHE_EXPIRE_SECONDS)
+    logger.debug("Monthly entries for project %s: %s", project_id, result)
+    return conditional_json(request, {"entries_per_month": result})
+
+# Internal: fetch the 6-month per-month entries for one project
+async def fetch_entries_per_month(project_id: int) -> list:
+    table_name = await get_metrics_table(project_id)
     try:
-        with conn.cursor() as cursor:
-            query = f"""
-                SELECT 
-                    DATE_FORMAT(last_updated, '%M') AS month, 
-                    SUM(update_count) AS total_updates
-                FROM `{table_name}`
-                WHERE last_updated >= CURDATE() - INTERVAL 6 MONTH
-                GROUP BY DATE_FORMAT(last_updated, '%M')
-                ORDER BY MIN(last_updated)
-            """
-            cursor.execute(query)
-            result = cursor.fetchall()
-            logger.debug(f"Monthly entries for project {project_id}: {result}")
-            return {"entries_per_month": result}
+        return await fetch_entries(table_name, ENTRIES_PER_MONTH_ROLLUP_SQL, ENTRIES_PER_MONTH_SQL)
     except pymysql.ProgrammingError as e:
-        logger.error(f"Query error for monthly entries for project {project_id}: {e}")
+        logger.error("Query error for monthly entries for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
     except pymysql.MySQLError as e:
-        logger.error(f"Database error for monthly entries for project {project_id}: {e}")
+        logger.error("Database error for monthly entries for project %s: %s", project_id, e)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+
+# Endpoint: /cache/clear (admin invalidation after DB writes)
+@app.post("/cache/clear")
+async def clear_cache():
+    await FastAPICache.clear()
+    clear_swr_cache()
+    clear_table_name_cache()
+    logger.debug("Response cache cleared")
+    return {"status": "cache cleared"}
 
 if __name__ == "__main__":
     import uvicorn
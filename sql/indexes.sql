@@ -0,0 +1,14 @@
+-- Indexes for a project's metrics table.
+-- Replace <metrics_table> with the table_name registered in `projects`
+-- (table names are validated against [A-Za-z_][A-Za-z0-9_]*, so the
+-- index names below can be generated per table the same way).
+
+-- Latest-row endpoints (/metrics/{id}, /total-users, /top-user, /bundle)
+-- run ORDER BY last_updated DESC LIMIT 1; a descending index turns the
+-- scan-and-sort into a B-tree tail lookup.
+CREATE INDEX `idx_<metrics_table>_lu` ON `<metrics_table>` (last_updated DESC);
+
+-- The by-date/today aggregates filter on a last_updated range and read
+-- only these columns; covering them avoids secondary row lookups.
+CREATE INDEX `idx_<metrics_table>_lu_cover`
+    ON `<metrics_table>` (last_updated, update_count, top_user, top_user_count, total_users);
@@ -0,0 +1,30 @@
+-- Daily rollup table for a project's metrics table.
+-- Replace <metrics_table> with the table_name registered in `projects`.
+-- The API reads `<metrics_table>_daily` for the entries-per-day /
+-- entries-per-weekday / entries-per-month endpoints when it exists and
+-- falls back to aggregating the raw rows when it does not.
+
+CREATE TABLE IF NOT EXISTS `<metrics_table>_daily` (
+    day DATE PRIMARY KEY,
+    total_updates BIGINT NOT NULL
+);
+
+-- Refresh the last two days every 5 minutes so late-arriving rows are
+-- folded in; older days are immutable once rolled up.
+-- Requires the MySQL event scheduler: SET GLOBAL event_scheduler = ON;
+CREATE EVENT IF NOT EXISTS `<metrics_table>_daily_refresh`
+ON SCHEDULE EVERY 5 MINUTE
+DO
+    INSERT INTO `<metrics_table>_daily` (day, total_updates)
+    SELECT DATE(last_updated), SUM(update_count)
+    FROM `<metrics_table>`
+    WHERE last_updated >= CURDATE() - INTERVAL 1 DAY
+    GROUP BY DATE(last_updated)
+    ON DUPLICATE KEY UPDATE total_updates = VALUES(total_updates);
+
+-- One-off backfill for existing history:
+-- INSERT INTO `<metrics_table>_daily` (day, total_updates)
+-- SELECT DATE(last_updated), SUM(update_count)
+-- FROM `<metrics_table>`
+-- GROUP BY DATE(last_updated)
+-- ON DUPLICATE KEY UPDATE total_updates = VALUES(total_updates);